@@ -0,0 +1,35 @@
+"""add aggregate plays count index
+
+Revision ID: a4f1e3c2b9d7
+Revises: 9562cf365cf4
+Create Date: 2021-08-02 11:04:12.318520
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a4f1e3c2b9d7"
+down_revision = "9562cf365cf4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add an index on the aggregate_plays materialized view matching the sort=plays
+    # order by so tracks can be read in play count order without sorting the join
+    connection = op.get_bind()
+    connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS aggregate_plays_count_idx ON aggregate_plays (count DESC, play_item_id DESC);
+    """
+    )
+
+
+def downgrade():
+    connection = op.get_bind()
+    connection.execute(
+        """
+        DROP INDEX IF EXISTS aggregate_plays_count_idx;
+    """
+    )
@@ -0,0 +1,37 @@
+"""add live tracks partial index
+
+Revision ID: c8d2a6f0e41b
+Revises: a4f1e3c2b9d7
+Create Date: 2021-08-03 16:22:48.905113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "c8d2a6f0e41b"
+down_revision = "a4f1e3c2b9d7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add a partial index over only the current, listed, non deleted, non stem tracks
+    # which are the rows the track list endpoints read
+    connection = op.get_bind()
+    connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS tracks_live_owner_created_at_idx
+        ON tracks (owner_id, created_at DESC, track_id DESC)
+        WHERE is_current AND NOT is_unlisted AND NOT is_delete AND stem_of IS NULL;
+    """
+    )
+
+
+def downgrade():
+    connection = op.get_bind()
+    connection.execute(
+        """
+        DROP INDEX IF EXISTS tracks_live_owner_created_at_idx;
+    """
+    )
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Tuple
 
 from web3 import Web3
@@ -91,8 +92,14 @@ def is_valid_oracle(address: str) -> bool:
     return address in oracle_addresses
 
 
+@lru_cache(maxsize=None)
+def get_private_key(private_key: str) -> keys.PrivateKey:
+    """Parses the hex private key once rather than on every signature"""
+    return keys.PrivateKey(HexBytes(private_key))
+
+
 def sign_attestation(attestation_bytes: bytes, private_key: str):
-    k = keys.PrivateKey(HexBytes(private_key))
+    k = get_private_key(private_key)
     to_sign_hash = Web3.keccak(attestation_bytes)
     sig = k.sign_msg_hash(to_sign_hash)
     return sig.to_hex()
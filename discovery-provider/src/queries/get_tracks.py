@@ -1,80 +1,196 @@
 import logging  # pylint: disable=C0302
+import hashlib
+import json
 
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, tuple_
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import aliased
 from sqlalchemy.sql.functions import coalesce
 from src.models import AggregatePlays, Track, TrackRoute, User
 from src.utils import helpers, redis_connection
 from src.utils.db_session import get_db_read_replica
+from src.utils.redis_cache import get_pickled_key, pickle_and_set
+from src.utils.redis_constants import tracks_by_plays_redis_key
 from src.queries.query_helpers import (
-    add_query_pagination,
     add_users_to_tracks,
     get_pagination_vars,
+    get_track_loader,
     parse_sort_param,
     populate_track_metadata,
 )
-from src.queries.get_unpopulated_tracks import get_unpopulated_tracks
+from src.queries.get_unpopulated_tracks import (
+    current_track_filters,
+    get_unpopulated_tracks,
+    not_deleted_track_filter,
+    not_unlisted_track_filter,
+)
 
 logger = logging.getLogger(__name__)
 
 redis = redis_connection.get_redis()
 
 
+# Cache the track ids of non-id listings for 30 sec, or 60 sec for
+# unsorted listings of a user's tracks
+track_ids_ttl_sec = 30
+user_track_ids_ttl_sec = 60
+
+# The args read by _get_tracks that determine which track ids are returned
+track_ids_cache_args = [
+    "slug",
+    "id",
+    "user_id",
+    "handle",
+    "filter_deleted",
+    "sort",
+    "after_track_id",
+    "limit",
+    "offset",
+]
+
+
+def get_track_ids_cache_key(args):
+    cache_args = {key: args[key] for key in track_ids_cache_args if key in args}
+    if "id" in cache_args:
+        # The id list is only used as an IN filter, so order and duplicates don't matter
+        cache_args["id"] = sorted(set(cache_args["id"]))
+    args_hash = hashlib.sha1(
+        json.dumps(cache_args, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"tracks:ids:{args_hash}"
+
+
+# Args that filter tracks beyond what the tracks by plays sorted set holds
+tracks_by_plays_filter_args = [
+    "slug",
+    "id",
+    "user_id",
+    "handle",
+    "min_block_number",
+    "after_track_id",
+]
+
+
+def get_track_ids_by_plays(limit, offset):
+    """
+    Returns a page of listed, non deleted track ids ordered by play count from the
+    sorted set written by the materialized views task, or None if it isn't built
+    """
+    track_ids = redis.zrevrange(tracks_by_plays_redis_key, offset, offset + limit - 1)
+    if not track_ids and not redis.exists(tracks_by_plays_redis_key):
+        return None
+    return [int(track_id) for track_id in track_ids]
+
+
+def _get_date_sort_key(model):
+    return coalesce(
+        # This func is defined in alembic migrations
+        func.to_date_safe(model.release_date, "Dy Mon DD YYYY HH24:MI:SS"),
+        model.created_at,
+    )
+
+
+# Bakery for the _get_tracks query. Each step below is a lambda over bound params
+# only, so every combination of args is built and compiled to SQL once per process
+# and later calls with the same args shape reuse the compiled statement.
+bakery = baked.bakery()
+
+AfterTrack = aliased(Track)
+AfterPlays = aliased(AggregatePlays)
+
+
 def _get_tracks(session, args):
     # Create initial query
-    base_query = session.query(Track)
-    base_query = base_query.filter(Track.is_current == True, Track.stem_of == None)
+    bq = bakery(lambda session: session.query(Track))
+    bq += lambda q: q.filter(*current_track_filters)
+    params = {}
 
     # Note that if slug is included, we should only get one track
     # The user ID filter should also be included
     if "slug" in args:
-        slug = args.get("slug")
-        base_query = base_query.join(
+        bq += lambda q: q.join(
             TrackRoute, TrackRoute.track_id == Track.track_id
-        ).filter(TrackRoute.slug == slug)
+        ).filter(TrackRoute.slug == bindparam("slug"))
+        params["slug"] = args.get("slug")
 
-    # Only return unlisted tracks if slug and user_id are present
-    if not "slug" in args or not "user_id" in args:
-        base_query = base_query.filter(Track.is_unlisted == False)
+    # Only return unlisted tracks if slug and user_id or handle are present
+    if not "slug" in args or not ("user_id" in args or "handle" in args):
+        bq += lambda q: q.filter(not_unlisted_track_filter)
 
     # Conditionally process an array of tracks
     if "id" in args:
-        track_id_list = args.get("id")
-        try:
-            # Update query with track_id list
-            base_query = base_query.filter(Track.track_id.in_(track_id_list))
-        except ValueError as e:
-            logger.error("Invalid value found in track id list", exc_info=True)
-            raise e
+        # Dedupe and sort the ids so the IN list is as small as possible and
+        # the same set of ids always binds the same params
+        track_id_list = sorted(set(args.get("id")))
+        if not track_id_list:
+            return []
+        bq += lambda q: q.filter(
+            Track.track_id.in_(bindparam("track_ids", expanding=True))
+        )
+        params["track_ids"] = track_id_list
 
     # Allow filtering of tracks by a certain creator
     if "user_id" in args:
-        user_id = args.get("user_id")
-        base_query = base_query.filter(Track.owner_id == user_id)
+        bq += lambda q: q.filter(Track.owner_id == bindparam("user_id"))
+        params["user_id"] = args.get("user_id")
+    elif "handle" in args:
+        bq += lambda q: q.join(User, User.user_id == Track.owner_id).filter(
+            User.handle_lc == bindparam("handle_lc"), User.is_current == True
+        )
+        params["handle_lc"] = args.get("handle").lower()
 
     # Allow filtering of deletes
     if "filter_deleted" in args:
         filter_deleted = args.get("filter_deleted")
         if filter_deleted:
-            base_query = base_query.filter(Track.is_delete == False)
+            bq += lambda q: q.filter(not_deleted_track_filter)
 
     if "min_block_number" in args:
-        min_block_number = args.get("min_block_number")
-        base_query = base_query.filter(Track.blocknumber >= min_block_number)
+        bq += lambda q: q.filter(Track.blocknumber >= bindparam("min_block_number"))
+        params["min_block_number"] = args.get("min_block_number")
+
+    # Date and plays sorts support keyset pagination: when after_track_id is given,
+    # resume after that track in the sort order instead of skipping `offset` rows
+    after_track_id = args.get("after_track_id")
+    use_keyset_pagination = after_track_id is not None and args.get("sort") in [
+        "date",
+        "plays",
+    ]
+    if use_keyset_pagination:
+        params["after_track_id"] = after_track_id
 
     if "sort" in args:
         if args["sort"] == "date":
-            base_query = base_query.order_by(
-                coalesce(
-                    # This func is defined in alembic migrations
-                    func.to_date_safe(Track.release_date, "Dy Mon DD YYYY HH24:MI:SS"),
-                    Track.created_at,
-                ).desc(),
-                Track.track_id.desc(),
+            bq += lambda q: q.order_by(
+                _get_date_sort_key(Track).desc(), Track.track_id.desc()
             )
+            if use_keyset_pagination:
+                bq += lambda q: q.filter(
+                    tuple_(_get_date_sort_key(Track), Track.track_id)
+                    < tuple_(
+                        q.session.query(_get_date_sort_key(AfterTrack))
+                        .filter(
+                            AfterTrack.track_id == bindparam("after_track_id"),
+                            AfterTrack.is_current == True,
+                        )
+                        .as_scalar(),
+                        bindparam("after_track_id"),
+                    )
+                )
         elif args["sort"] == "plays":
-            base_query = base_query.join(
+            bq += lambda q: q.join(
                 AggregatePlays, AggregatePlays.play_item_id == Track.track_id
-            ).order_by(AggregatePlays.count.desc())
+            ).order_by(AggregatePlays.count.desc(), Track.track_id.desc())
+            if use_keyset_pagination:
+                bq += lambda q: q.filter(
+                    tuple_(AggregatePlays.count, Track.track_id)
+                    < tuple_(
+                        q.session.query(AfterPlays.count)
+                        .filter(AfterPlays.play_item_id == bindparam("after_track_id"))
+                        .as_scalar(),
+                        bindparam("after_track_id"),
+                    )
+                )
         else:
             whitelist_params = [
                 "created_at",
@@ -83,10 +199,21 @@ def _get_tracks(session, args):
                 "blocknumber",
                 "track_id",
             ]
-            base_query = parse_sort_param(base_query, Track, whitelist_params)
+            # The order by is read from the request, so don't cache from here on
+            bq.spoil()
+            bq += lambda q: parse_sort_param(q, Track, whitelist_params)
 
-    query_results = add_query_pagination(base_query, args["limit"], args["offset"])
-    tracks = helpers.query_result_to_list(query_results.all())
+    bq += lambda q: q.limit(bindparam("limit"))
+    params["limit"] = args["limit"]
+    if not use_keyset_pagination:
+        bq += lambda q: q.offset(bindparam("offset"))
+        params["offset"] = args["offset"]
+
+    # All the rows of the page are fetched at once. yield_per can't be used here
+    # since Track eager loads its user and route collections with joins, and the
+    # page size is already capped by get_pagination_vars.
+    query_results = bq(session).params(**params)
+    tracks = helpers.query_result_to_list(query_results)
     return tracks
 
 
@@ -98,63 +225,116 @@ def get_tracks(args):
         and within this method using the shared get_unpopulated_tracks cache.
 
         The shared cache only works when fetching via ID, so calls to fetch tracks
-        via handle, asc/desc sort, or filtering by block_number won't hit the shared cache.
-        These will hit the API cache unless they have a current_user_id included.
+        via handle, date/plays sort, or slug first resolve their track ids through
+        a short-lived redis cache keyed by the query args, then hydrate the tracks
+        from the shared cache. Unfiltered sort=plays listings page through a redis
+        sorted set of play counts instead. Calls filtering by block_number, using
+        a custom asc/desc sort or with a current_user_id included bypass the track
+        id cache, and will hit the API cache unless they have a current_user_id.
 
     """
-    tracks = []
-
     db = get_db_read_replica()
     with db.scoped_session() as session:
+        return _get_populated_tracks(session, args)
+
+
+def can_use_shared_cache(args):
+    return (
+        "id" in args
+        and not "min_block_number" in args
+        and not "sort" in args
+        and not "user_id" in args
+        and not "handle" in args
+    )
 
-        def get_tracks_and_ids():
-            if "handle" in args:
-                handle = args.get("handle")
-                user_id = (
-                    session.query(User.user_id)
-                    .filter(User.handle_lc == handle.lower())
-                    .first()
-                )
-                args["user_id"] = user_id
 
-            can_use_shared_cache = (
-                "id" in args
-                and not "min_block_number" in args
-                and not "sort" in args
-                and not "user_id" in args
+def _get_populated_tracks(session, args):
+    def get_tracks_and_ids():
+        if can_use_shared_cache(args):
+            should_filter_deleted = args.get("filter_deleted", False)
+            tracks = get_track_loader().load_many(
+                session, args["id"], should_filter_deleted
             )
+            track_ids = [track["track_id"] for track in tracks]
+            return (tracks, track_ids)
 
-            if can_use_shared_cache:
-                should_filter_deleted = args.get("filter_deleted", False)
-                tracks = get_unpopulated_tracks(
-                    session, args["id"], should_filter_deleted
-                )
-                track_ids = list(map(lambda track: track["track_id"], tracks))
-                return (tracks, track_ids)
+        (limit, offset) = get_pagination_vars()
+        args["limit"] = limit
+        args["offset"] = offset
 
-            (limit, offset) = get_pagination_vars()
-            args["limit"] = limit
-            args["offset"] = offset
+        can_use_tracks_by_plays = (
+            args.get("sort") == "plays"
+            and args.get("filter_deleted", False)
+            and not any(arg in args for arg in tracks_by_plays_filter_args)
+        )
+        if can_use_tracks_by_plays:
+            track_ids = get_track_ids_by_plays(limit, offset)
+            if track_ids is not None:
+                if not track_ids:
+                    return ([], [])
+                tracks = get_unpopulated_tracks(session, track_ids, True)
+                track_ids = [track["track_id"] for track in tracks]
+                return (tracks, track_ids)
 
+        # Listings polling on min_block_number or requested by a user, who must
+        # see their own writes, are not served stale, and custom sorts are read
+        # from the request rather than args
+        can_use_track_ids_cache = (
+            not "min_block_number" in args
+            and not args.get("current_user_id")
+            and (not "sort" in args or args["sort"] in ["date", "plays"])
+        )
+        if not can_use_track_ids_cache:
             tracks = _get_tracks(session, args)
+            track_ids = [track["track_id"] for track in tracks]
+            return (tracks, track_ids)
 
-            track_ids = list(map(lambda track: track["track_id"], tracks))
-
+        track_ids_key = get_track_ids_cache_key(args)
+        cached_track_ids = get_pickled_key(redis, track_ids_key)
+        if cached_track_ids:
+            # Unlisted tracks are only returned when fetching by slug and user_id or handle
+            should_filter_unlisted = not "slug" in args or not (
+                "user_id" in args or "handle" in args
+            )
+            tracks = get_unpopulated_tracks(
+                session,
+                cached_track_ids,
+                args.get("filter_deleted", False),
+                should_filter_unlisted,
+            )
+            track_ids = [track["track_id"] for track in tracks]
             return (tracks, track_ids)
 
-        (tracks, track_ids) = get_tracks_and_ids()
+        tracks = _get_tracks(session, args)
 
-        # bundle peripheral info into track results
-        current_user_id = args.get("current_user_id")
+        track_ids = [track["track_id"] for track in tracks]
 
-        tracks = populate_track_metadata(session, track_ids, tracks, current_user_id)
+        # Empty results aren't cached so that tracks which were just indexed,
+        # e.g. a new track resolved by slug, are found on the next request
+        if track_ids:
+            is_user_listing = (
+                "user_id" in args or "handle" in args
+            ) and not "sort" in args
+            pickle_and_set(
+                redis,
+                track_ids_key,
+                track_ids,
+                user_track_ids_ttl_sec if is_user_listing else track_ids_ttl_sec,
+            )
 
-        if args.get("with_users", False):
-            add_users_to_tracks(session, tracks, current_user_id)
-        else:
-            # Remove the user from the tracks
-            tracks = [
-                {key: val for key, val in dict.items() if key != "user"}
-                for dict in tracks
-            ]
+        return (tracks, track_ids)
+
+    (tracks, track_ids) = get_tracks_and_ids()
+
+    # bundle peripheral info into track results
+    current_user_id = args.get("current_user_id")
+
+    tracks = populate_track_metadata(session, track_ids, tracks, current_user_id)
+
+    if args.get("with_users", False):
+        add_users_to_tracks(session, tracks, current_user_id)
+    else:
+        # Remove the user from the tracks
+        for track in tracks:
+            track.pop("user", None)
     return tracks
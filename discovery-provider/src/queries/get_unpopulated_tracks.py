@@ -11,6 +11,11 @@ logger = logging.getLogger(__name__)
 # Cache unpopulated tracks for 5 min
 ttl_sec = 5 * 60
 
+# Track filters built once at import and shared by the track queries
+current_track_filters = (Track.is_current == True, Track.stem_of == None)
+not_unlisted_track_filter = Track.is_unlisted == False
+not_deleted_track_filter = Track.is_delete == False
+
 
 def get_cached_tracks(track_ids):
     redis_track_id_keys = map(get_track_id_cache_key, track_ids)
@@ -76,15 +81,15 @@ def get_unpopulated_tracks(
 
     tracks_query = (
         session.query(Track)
-        .filter(Track.is_current == True, Track.stem_of == None)
+        .filter(*current_track_filters)
         .filter(Track.track_id.in_(track_ids_to_fetch))
     )
 
     if filter_unlisted:
-        tracks_query = tracks_query.filter(Track.is_unlisted == False)
+        tracks_query = tracks_query.filter(not_unlisted_track_filter)
 
     if filter_deleted:
-        tracks_query = tracks_query.filter(Track.is_delete == False)
+        tracks_query = tracks_query.filter(not_deleted_track_filter)
 
     tracks = tracks_query.all()
     tracks = helpers.query_result_to_list(tracks)
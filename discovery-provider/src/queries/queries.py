@@ -102,6 +102,8 @@ def get_tracks_route():
         args["with_users"] = parse_bool_param(request.args.get("with_users"))
     if "min_block_number" in request.args:
         args["min_block_number"] = request.args.get("min_block_number", type=int)
+    if "after_track_id" in request.args:
+        args["after_track_id"] = request.args.get("after_track_id", type=int)
     current_user_id = get_current_user_id(required=False)
     args["current_user_id"] = current_user_id
     tracks = get_tracks(args)
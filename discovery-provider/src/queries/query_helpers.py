@@ -2,7 +2,7 @@
 import logging
 from sqlalchemy import func, desc, text, Integer, and_, bindparam
 
-from flask import request
+from flask import g, request
 
 from src import exceptions
 from src.queries import response_name_constants
@@ -18,11 +18,11 @@ from src.models import (
     Remix,
     AggregatePlays,
     AggregateUser,
-    AggregateTrack,
     AggregatePlaylist,
 )
 from src.utils import helpers, redis_connection
 from src.queries.get_unpopulated_users import get_unpopulated_users, set_users_in_cache
+from src.queries.get_unpopulated_tracks import get_unpopulated_tracks
 from src.queries.get_balances import get_balances
 
 logger = logging.getLogger(__name__)
@@ -276,33 +276,52 @@ def get_track_play_count_dict(session, track_ids):
     return track_play_dict
 
 
-# given list of track ids and corresponding tracks, populates each track object with:
-#   repost_count, save_count
-#   if remix: remix users, has_remix_author_reposted, has_remix_author_saved
-#   if current_user_id available, populates followee_reposts, has_current_user_reposted, has_current_user_saved
-def populate_track_metadata(session, track_ids, tracks, current_user_id):
-    # build dict of track id --> repost count
-    counts = (
-        session.query(
-            AggregateTrack.track_id,
-            AggregateTrack.repost_count,
-            AggregateTrack.save_count,
-        )
-        .filter(
-            AggregateTrack.track_id.in_(track_ids),
-        )
-        .all()
+def get_track_counts_dict(session, track_ids):
+    """Returns a dict of track id --> repost, save and play counts in one round trip"""
+    if not track_ids:
+        return {}
+    # Tracks can have plays before they are in aggregate_track and vice versa,
+    # so full outer join the two aggregates
+    query = text(
+        """
+        select
+            coalesce(track_counts.track_id, play_counts.play_item_id),
+            track_counts.repost_count,
+            track_counts.save_count,
+            play_counts.count
+        from (
+            select track_id, repost_count, save_count
+            from aggregate_track
+            where track_id in :ids
+        ) as track_counts
+        full outer join (
+            select play_item_id, count
+            from aggregate_plays
+            where play_item_id in :ids
+        ) as play_counts
+        on play_counts.play_item_id = track_counts.track_id
+        """
     )
+    query = query.bindparams(bindparam("ids", expanding=True))
 
-    count_dict = {
+    counts = session.execute(query, {"ids": track_ids}).fetchall()
+    return {
         track_id: {
-            response_name_constants.repost_count: repost_count,
-            response_name_constants.save_count: save_count,
+            response_name_constants.repost_count: repost_count or 0,
+            response_name_constants.save_count: save_count or 0,
+            response_name_constants.play_count: play_count or 0,
         }
-        for (track_id, repost_count, save_count) in counts
+        for (track_id, repost_count, save_count, play_count) in counts
     }
 
-    play_count_dict = get_track_play_count_dict(session, track_ids)
+
+# given list of track ids and corresponding tracks, populates each track object with:
+#   repost_count, save_count
+#   if remix: remix users, has_remix_author_reposted, has_remix_author_saved
+#   if current_user_id available, populates followee_reposts, has_current_user_reposted, has_current_user_saved
+def populate_track_metadata(session, track_ids, tracks, current_user_id):
+    # build dict of track id --> repost, save and play count
+    count_dict = get_track_counts_dict(session, track_ids)
 
     remixes = get_track_remix_metadata(session, tracks, current_user_id)
 
@@ -384,7 +403,9 @@ def populate_track_metadata(session, track_ids, tracks, current_user_id):
         track[response_name_constants.save_count] = count_dict.get(track_id, {}).get(
             response_name_constants.save_count, 0
         )
-        track[response_name_constants.play_count] = play_count_dict.get(track_id, 0)
+        track[response_name_constants.play_count] = count_dict.get(track_id, {}).get(
+            response_name_constants.play_count, 0
+        )
         # current user specific
         track[
             response_name_constants.followee_reposts
@@ -1276,13 +1297,22 @@ def add_users_to_tracks(session, tracks, current_user_id=None):
     Returns: None
     """
     user_ids = get_users_ids(tracks)
-    users = []
-    if tracks and len(tracks) > 0 and tracks[0].get("user"):
-        users = list(map(lambda t: t["user"][0], tracks))
-    else:
+    # Owners are eager loaded in the same query as the tracks via the joined
+    # `Track.user` relationship, so use those and dedupe by user id
+    preloaded_users = {}
+    for track in tracks:
+        if track.get("user"):
+            user = track["user"][0]
+            preloaded_users[user["user_id"]] = user
+    users = list(preloaded_users.values())
+
+    missing_user_ids = [
+        user_id for user_id in user_ids if user_id not in preloaded_users
+    ]
+    if missing_user_ids:
         # This shouldn't happen - all tracks should come preloaded with their owners per the relationship
-        users = get_unpopulated_users(session, user_ids)
         logger.warning("add_users_to_tracks() called but tracks have no users")
+        users = users + get_unpopulated_users(session, missing_user_ids)
     set_users_in_cache(users)
     # bundle peripheral info into user results
     populated_users = populate_user_metadata(session, user_ids, users, current_user_id)
@@ -1294,3 +1324,65 @@ def add_users_to_tracks(session, tracks, current_user_id=None):
         user = user_map[track["owner_id"]]
         if user:
             track["user"] = user
+
+
+class TrackLoader:
+    """
+    Request scoped loader for unpopulated tracks. Tracks fetched by id are kept for
+    the rest of the request, so repeated get_tracks calls with overlapping ids only
+    query the tracks they have not already loaded.
+    """
+
+    def __init__(self):
+        # track id --> unpopulated track, or None if there is no such track
+        self.tracks = {}
+
+    def load_many(self, session, track_ids, filter_deleted=False):
+        track_ids_to_fetch = [
+            track_id for track_id in set(track_ids) if track_id not in self.tracks
+        ]
+        if track_ids_to_fetch:
+            tracks = get_unpopulated_tracks(
+                session, track_ids_to_fetch, filter_unlisted=False
+            )
+            for track in tracks:
+                self.tracks[track["track_id"]] = track
+            for track_id in track_ids_to_fetch:
+                self.tracks.setdefault(track_id, None)
+
+        loaded_tracks = []
+        for track_id in track_ids:
+            track = self.tracks[track_id]
+            if track is None or track["is_unlisted"]:
+                continue
+            if filter_deleted and track["is_delete"]:
+                continue
+            loaded_tracks.append(copy_unpopulated_track(track))
+        return loaded_tracks
+
+
+def copy_unpopulated_track(track):
+    """
+    Copies a loaded track so it can be populated without modifying the loader's track.
+    populate_track_metadata and add_users_to_tracks only set keys on the track, its
+    owner and its remix_of tracks, so only those dicts are copied.
+    """
+    track_copy = dict(track)
+    if track_copy.get("user"):
+        track_copy["user"] = [dict(user) for user in track_copy["user"]]
+    remix_of = track_copy.get(response_name_constants.remix_of)
+    if type(remix_of) is dict:
+        remix_of = dict(remix_of)
+        if type(remix_of.get("tracks")) is list:
+            remix_of["tracks"] = [
+                dict(remix_track) for remix_track in remix_of["tracks"]
+            ]
+        track_copy[response_name_constants.remix_of] = remix_of
+    return track_copy
+
+
+def get_track_loader():
+    """Returns the TrackLoader for the current request, which is discarded on teardown"""
+    if "track_loader" not in g:
+        g.track_loader = TrackLoader()
+    return g.track_loader
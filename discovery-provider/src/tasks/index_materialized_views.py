@@ -1,9 +1,14 @@
 import logging
 import time
 from src.tasks.celery_app import celery
+from src.utils.redis_constants import tracks_by_plays_redis_key
 
 logger = logging.getLogger(__name__)
 
+# The views are refreshed every 5 min, keep the tracks by plays set for a few
+# refreshes so a stalled task doesn't serve a stale ranking indefinitely
+TRACKS_BY_PLAYS_TTL_SEC = 60 * 15
+
 # Vacuum can't happen inside a db txn, so we have to acquire
 # a new connection and set it's isolation level to AUTOCOMMIT
 # as per: https://stackoverflow.com/questions/1017463/postgresql-how-to-run-vacuum-from-code-outside-transaction-block
@@ -25,7 +30,66 @@ def vacuum_matviews(db):
     )
 
 
-def update_views(self, db):
+def get_tracks_by_plays_member(track_id):
+    return f"{track_id:012d}"
+
+
+def cache_tracks_by_plays(session, redis, batch_size=10000):
+    """
+    Writes the play count of every listed, non deleted track to a redis sorted set
+    so sort=plays track listings can page through it instead of joining
+    aggregate_plays in the DB. The set is built under a temporary key and renamed
+    so readers never see a partial set. It expires after a few refresh intervals,
+    so listings fall back to the DB if this task stops running.
+
+    Members are zero padded track ids so that tracks with equal play counts are
+    returned by ZREVRANGE in track_id DESC order, matching the DB sort=plays order.
+    """
+    # Stream the rows with a server side cursor so only one batch is held at a time
+    play_counts = (
+        session.connection()
+        .execution_options(stream_results=True)
+        .execute(
+            """
+            SELECT ap.play_item_id, ap.count
+            FROM aggregate_plays ap
+            JOIN tracks t ON t.track_id = ap.play_item_id
+            WHERE
+                t.is_current IS TRUE AND
+                t.is_delete IS FALSE AND
+                t.is_unlisted IS FALSE AND
+                t.stem_of IS NULL
+            """
+        )
+    )
+
+    # Load each batch separately so redis isn't blocked for the whole load,
+    # the final rename is atomic on its own
+    tmp_key = f"{tracks_by_plays_redis_key}:tmp"
+    redis.delete(tmp_key)
+    has_play_counts = False
+    while True:
+        batch = play_counts.fetchmany(batch_size)
+        if not batch:
+            break
+        has_play_counts = True
+        redis.zadd(
+            tmp_key,
+            {
+                get_tracks_by_plays_member(track_id): count
+                for (track_id, count) in batch
+            },
+        )
+
+    if not has_play_counts:
+        redis.delete(tracks_by_plays_redis_key)
+        return
+
+    redis.expire(tmp_key, TRACKS_BY_PLAYS_TTL_SEC)
+    redis.rename(tmp_key, tracks_by_plays_redis_key)
+
+
+def update_views(self, db, redis):
     with db.scoped_session() as session:
         start_time = time.time()
         logger.info("index_materialized_views.py | Updating materialized views")
@@ -36,6 +100,16 @@ def update_views(self, db):
         session.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY tag_track_user")
         session.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY aggregate_plays")
 
+    # Built after the refreshes commit so a failure here doesn't roll them back
+    try:
+        with db.scoped_session() as session:
+            cache_tracks_by_plays(session, redis)
+    except Exception:
+        logger.error(
+            "index_materialized_views.py | Failed to cache tracks by plays",
+            exc_info=True,
+        )
+
     vacuum_matviews(db)
 
     logger.info(
@@ -59,7 +133,7 @@ def update_materialized_views(self):
         # Attempt to acquire lock - do not block if unable to acquire
         have_lock = update_lock.acquire(blocking=False)
         if have_lock:
-            update_views(self, db)
+            update_views(self, db, redis)
         else:
             logger.info(
                 "index_materialized_views.py | Failed to acquire update_materialized_views"
@@ -12,3 +12,4 @@ challenges_last_processed_event_redis_key = "challenges:last-processed-event"
 user_balances_refresh_last_completion_redis_key = "user_balances:last-completion"
 latest_sol_play_tx_key = "latest_sol_play_tx_key"
 index_eth_last_completion_redis_key = "index_eth:last-completion"
+tracks_by_plays_redis_key = "tracks:by-plays"
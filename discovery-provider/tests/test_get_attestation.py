@@ -3,7 +3,6 @@ import redis
 from web3 import Web3
 from eth_keys import keys
 from eth_utils.conversions import to_bytes
-from hexbytes import HexBytes
 
 from src.queries.get_attestation import (
     Attestation,
@@ -19,6 +18,8 @@ from tests.test_get_challenges import setup_db
 REDIS_URL = shared_config["redis"]["url"]
 redis_handle = redis.Redis.from_url(url=REDIS_URL)
 
+config_owner_wallet = shared_config["delegate"]["owner_wallet"]
+
 
 def test_get_attestation(app):
     with app.app_context():
@@ -53,24 +54,16 @@ def test_get_attestation(app):
 
             # Test happy path
 
-            # confirm the attestation is what we think it should be
-            config_owner_wallet = shared_config["delegate"]["owner_wallet"]
-            config_private_key = shared_config["delegate"]["private_key"]
-
             # Ensure we returned the correct owner wallet
             assert delegate_owner_wallet == config_owner_wallet
 
             # Ensure we can derive the owner wallet from the signed stringified attestation
             attestation_bytes = attestation.get_attestation_bytes()
             to_sign_hash = Web3.keccak(attestation_bytes)
-            private_key = keys.PrivateKey(HexBytes(config_private_key))
-            public_key = keys.PublicKey.from_private(private_key)
-            signture_bytes = to_bytes(hexstr=signature)
-            msg_signature = keys.Signature(signature_bytes=signture_bytes, vrs=None)
+            signature_bytes = to_bytes(hexstr=signature)
+            msg_signature = keys.Signature(signature_bytes=signature_bytes, vrs=None)
 
-            recovered_pubkey = public_key.recover_from_msg_hash(
-                message_hash=to_sign_hash, signature=msg_signature
-            )
+            recovered_pubkey = keys.ecdsa_recover(to_sign_hash, msg_signature)
 
             assert (
                 Web3.toChecksumAddress(recovered_pubkey.to_address())
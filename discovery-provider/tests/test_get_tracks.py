@@ -1,8 +1,21 @@
 from datetime import datetime
 
 from src.queries.get_remixable_tracks import get_remixable_tracks
-from src.queries.get_tracks import _get_tracks
+from src.queries.query_helpers import TrackLoader, copy_unpopulated_track
+from src.queries.get_tracks import (
+    _get_tracks,
+    get_track_ids_cache_key,
+    get_tracks,
+)
+from src.tasks.index_materialized_views import (
+    TRACKS_BY_PLAYS_TTL_SEC,
+    cache_tracks_by_plays,
+    get_tracks_by_plays_member,
+)
 from src.utils.db_session import get_db
+from src.utils.redis_cache import get_pickled_key, pickle_and_set
+from src.utils.redis_connection import get_redis
+from src.utils.redis_constants import tracks_by_plays_redis_key
 
 from tests.utils import populate_mock_db
 
@@ -118,6 +131,46 @@ def test_get_tracks_by_date(app):
         assert tracks[4]["permalink"] == "/some-test-user/track-2"
 
 
+def test_get_tracks_by_date_after_track(app):
+    """Test keyset paginating tracks ordered by date"""
+
+    with app.app_context():
+        db = get_db()
+
+    populate_tracks(db)
+
+    with db.scoped_session() as session:
+        tracks = _get_tracks(
+            session,
+            {
+                "user_id": 1287289,
+                "offset": 0,
+                "limit": 2,
+                "sort": "date",
+                "after_track_id": 3,
+            },
+        )
+
+        assert len(tracks) == 2
+        assert tracks[0]["track_id"] == 5
+        assert tracks[1]["track_id"] == 4
+
+        # Offset is ignored when paginating after a track
+        tracks = _get_tracks(
+            session,
+            {
+                "user_id": 1287289,
+                "offset": 2,
+                "limit": 10,
+                "sort": "date",
+                "after_track_id": 4,
+            },
+        )
+
+        assert len(tracks) == 1
+        assert tracks[0]["track_id"] == 2
+
+
 def test_get_track_by_handle_slug(app):
     """Test getting track by user handle and slug for route resolution"""
     with app.app_context():
@@ -175,6 +228,217 @@ def test_get_track_by_handle_slug(app):
             assert len(tracks) == 0
 
 
+def test_get_tracks_by_handle(app):
+    """Test getting tracks filtered by the owner's handle"""
+    with app.app_context():
+        db = get_db()
+
+        populate_tracks(db)
+
+        with db.scoped_session() as session:
+            tracks = _get_tracks(
+                session,
+                {"handle": "Some-Other-User", "offset": 0, "limit": 10, "sort": "date"},
+            )
+            assert [track["track_id"] for track in tracks] == [6, 8, 7]
+
+            # Unlisted tracks are returned when fetching by handle and slug
+            tracks = _get_tracks(
+                session,
+                {
+                    "handle": "some-other-user",
+                    "slug": "hidden-track",
+                    "offset": 0,
+                    "limit": 10,
+                },
+            )
+            assert len(tracks) == 1
+            assert tracks[0]["track_id"] == 9
+
+            tracks = _get_tracks(
+                session, {"handle": "no-such-user", "offset": 0, "limit": 10}
+            )
+            assert len(tracks) == 0
+
+
+def test_get_track_ids_cache_key():
+    """Test the track ids cache key only depends on args that select track ids"""
+    args = {"user_id": 4, "sort": "date", "limit": 10, "offset": 0}
+    key = get_track_ids_cache_key(args)
+    assert key.startswith("tracks:ids:")
+
+    reordered_args = {"offset": 0, "limit": 10, "sort": "date", "user_id": 4}
+    assert get_track_ids_cache_key(reordered_args) == key
+
+    user_args = {**args, "current_user_id": 1, "with_users": True}
+    assert get_track_ids_cache_key(user_args) == key
+
+    assert get_track_ids_cache_key({**args, "offset": 10}) != key
+
+    ids_key = get_track_ids_cache_key({**args, "id": [3, 1, 3]})
+    assert get_track_ids_cache_key({**args, "id": [1, 3]}) == ids_key
+
+
+def test_track_loader(app):
+    """Test the track loader reuses tracks loaded earlier in the request"""
+    with app.app_context():
+        db = get_db()
+
+        populate_tracks(db)
+
+        with db.scoped_session() as session:
+            loader = TrackLoader()
+            tracks = loader.load_many(session, [1, 2, 9, 100])
+            assert [track["track_id"] for track in tracks] == [1, 2]
+            assert set(loader.tracks.keys()) == {1, 2, 9, 100}
+
+            # Loaded tracks are copies so callers can't modify the loader's tracks
+            tracks[0]["title"] = "modified"
+            tracks[0]["user"][0]["handle"] = "modified"
+            assert loader.tracks[1]["title"] != "modified"
+            assert loader.tracks[1]["user"][0]["handle"] == "some-test-user"
+
+            tracks = loader.load_many(session, [2, 3, 2])
+            assert [track["track_id"] for track in tracks] == [2, 3, 2]
+
+
+def test_copy_unpopulated_track():
+    """Test copying a loaded track copies the dicts populating it modifies"""
+    track = {
+        "track_id": 1,
+        "user": [{"user_id": 1}],
+        "remix_of": {"tracks": [{"parent_track_id": 2}]},
+    }
+    track_copy = copy_unpopulated_track(track)
+    track_copy["title"] = "modified"
+    track_copy["user"][0]["follower_count"] = 1
+    track_copy["remix_of"]["tracks"][0]["has_remix_author_saved"] = True
+    assert track == {
+        "track_id": 1,
+        "user": [{"user_id": 1}],
+        "remix_of": {"tracks": [{"parent_track_id": 2}]},
+    }
+
+
+def test_cache_tracks_by_plays(app):
+    """Test caching listed tracks by play count in a redis sorted set"""
+    with app.app_context():
+        db = get_db()
+        redis = get_redis()
+
+        populate_tracks(db)
+        populate_mock_db(
+            db,
+            {
+                "plays": [
+                    {"item_id": 1},
+                    {"item_id": 2},
+                    {"item_id": 2},
+                    {"item_id": 3},
+                    {"item_id": 3},
+                    {"item_id": 9},
+                    {"item_id": 9},
+                    {"item_id": 9},
+                ]
+            },
+        )
+
+        with db.scoped_session() as session:
+            session.execute("REFRESH MATERIALIZED VIEW aggregate_plays")
+            cache_tracks_by_plays(session, redis, batch_size=2)
+
+        # Unlisted track 9 is excluded and equal play counts are ordered by
+        # track_id desc, so 3 comes before 2
+        assert redis.zrevrange(tracks_by_plays_redis_key, 0, -1, withscores=True) == [
+            (get_tracks_by_plays_member(3).encode(), 2.0),
+            (get_tracks_by_plays_member(2).encode(), 2.0),
+            (get_tracks_by_plays_member(1).encode(), 1.0),
+        ]
+        assert 0 < redis.ttl(tracks_by_plays_redis_key) <= TRACKS_BY_PLAYS_TTL_SEC
+
+
+def test_get_tracks_by_plays(app):
+    """Test sort=plays listings are served from the sorted set when it is built"""
+    with app.app_context():
+        db = get_db()
+        redis = get_redis()
+
+        populate_tracks(db)
+        populate_mock_db(
+            db,
+            {
+                "plays": [
+                    {"item_id": 1},
+                    {"item_id": 2},
+                    {"item_id": 2},
+                    {"item_id": 3},
+                    {"item_id": 3},
+                ]
+            },
+        )
+        with db.scoped_session() as session:
+            session.execute("REFRESH MATERIALIZED VIEW aggregate_plays")
+
+    args = {"sort": "plays", "filter_deleted": True}
+    with app.test_request_context("/tracks?limit=10&offset=0"):
+        # Falls back to the DB when the sorted set isn't built
+        redis.delete(tracks_by_plays_redis_key)
+        tracks = get_tracks(dict(args))
+        assert [track["track_id"] for track in tracks] == [3, 2, 1]
+
+        # Served from the sorted set once it is built
+        with db.scoped_session() as session:
+            cache_tracks_by_plays(session, redis)
+        redis.zadd(tracks_by_plays_redis_key, {get_tracks_by_plays_member(1): 5})
+        tracks = get_tracks(dict(args))
+        assert [track["track_id"] for track in tracks] == [1, 3, 2]
+
+    with app.test_request_context("/tracks?limit=2&offset=1"):
+        tracks = get_tracks(dict(args))
+        assert [track["track_id"] for track in tracks] == [3, 2]
+
+
+def test_get_tracks_track_ids_cache(app):
+    """Test get_tracks caches the track ids of listings and hydrates cache hits"""
+    with app.app_context():
+        db = get_db()
+        redis = get_redis()
+
+        populate_tracks(db)
+
+    with app.test_request_context("/tracks?limit=10&offset=0"):
+        # Miss: unlisted track is found by handle and slug and its id is cached
+        args = {"handle": "some-other-user", "slug": "hidden-track"}
+        tracks = get_tracks(args)
+        assert [track["track_id"] for track in tracks] == [9]
+        key = get_track_ids_cache_key(args)
+        assert get_pickled_key(redis, key) == [9]
+
+        # Hit: cached ids are served, keeping unlisted tracks for handle and slug
+        pickle_and_set(redis, key, [9, 8])
+        tracks = get_tracks({"handle": "some-other-user", "slug": "hidden-track"})
+        assert [track["track_id"] for track in tracks] == [9, 8]
+
+        # Hit: unlisted tracks are filtered without a slug
+        args = {"handle": "some-other-user"}
+        tracks = get_tracks(args)
+        assert sorted(track["track_id"] for track in tracks) == [6, 7, 8]
+        pickle_and_set(redis, get_track_ids_cache_key(args), [9, 8])
+        tracks = get_tracks({"handle": "some-other-user"})
+        assert [track["track_id"] for track in tracks] == [8]
+
+        # Empty results aren't cached
+        args = {"handle": "some-other-user", "slug": "new-track"}
+        assert get_tracks(args) == []
+        assert get_pickled_key(redis, get_track_ids_cache_key(args)) is None
+
+        # Listings with a current user skip the cached [9, 8] ids from above, so
+        # owners see their own writes
+        args = {"handle": "some-other-user", "current_user_id": 4}
+        tracks = get_tracks(args)
+        assert sorted(track["track_id"] for track in tracks) == [6, 7, 8]
+
+
 def test_get_remixable_tracks(app):
 
     with app.app_context():